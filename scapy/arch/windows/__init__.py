@@ -10,13 +10,16 @@ Customizations needed to support Microsoft Windows.
 
 from __future__ import absolute_import
 from __future__ import print_function
+import ctypes
+import itertools
+import operator
 import os
 import platform as platform_lib
 import socket
 import subprocess as sp
-from glob import glob
 import struct
 import warnings
+from threading import Thread
 
 from scapy.arch.windows.structures import _windows_title, \
     GetAdaptersAddresses, GetIpForwardTable, GetIpForwardTable2, \
@@ -31,9 +34,9 @@ from scapy.error import (
     warning,
 )
 from scapy.interfaces import NetworkInterface, InterfaceProvider, \
-    dev_from_index, resolve_iface, network_name
+    dev_from_index, resolve_iface
 from scapy.pton_ntop import inet_ntop, inet_pton
-from scapy.utils import atol, itom, mac2str, str2mac
+from scapy.utils import itom, mac2str, str2mac
 from scapy.utils6 import construct_source_candidate_set, in6_getscope
 from scapy.data import ARPHDR_ETHER, load_manuf
 import scapy.modules.six as six
@@ -84,6 +87,10 @@ if not hasattr(socket, 'IPPROTO_ESP'):
 
 _WlanHelper = NPCAP_PATH + "\\WlanHelper.exe"
 
+# Resolved once: the native implementation (Python 3 only) is much faster
+# than Scapy's fallback. Addresses passed to it must already be bytes.
+_inet_ntop = getattr(socket, "inet_ntop", inet_ntop)
+
 
 def _encapsulate_admin(cmd):
     """Encapsulate a command with an Administrator flag"""
@@ -96,67 +103,112 @@ def _encapsulate_admin(cmd):
             "-ArgumentList '/c %s'\"" % cmd)
 
 
+# Cache of the Npcap registry parameters, cleared on interfaces reload
+_NPCAP_CONFIG_CACHE = None
+
+
 def _get_npcap_config(param_key):
     """
     Get a Npcap parameter matching key in the registry.
+    All the parameters are read at once, then cached until
+    _clear_npcap_config_cache() is called.
 
     List:
     AdminOnly, DefaultFilterSettings, DltNull, Dot11Adapters, Dot11Support
     LoopbackAdapter, LoopbackSupport, NdisImPlatformBindingOptions, VlanSupport
     WinPcapCompatible
     """
-    hkey = winreg.HKEY_LOCAL_MACHINE
-    node = r"SYSTEM\CurrentControlSet\Services\npcap\Parameters"
-    try:
-        key = winreg.OpenKey(hkey, node)
-        dot11_adapters, _ = winreg.QueryValueEx(key, param_key)
-        winreg.CloseKey(key)
-    except WindowsError:
-        return None
-    return dot11_adapters
-
-
-def _where(filename, dirs=None, env="PATH"):
-    """Find file in current dir, in deep_lookup cache or in system path"""
-    if dirs is None:
-        dirs = []
-    if not isinstance(dirs, list):
-        dirs = [dirs]
-    if glob(filename):
-        return filename
-    paths = [os.curdir] + os.environ[env].split(os.path.pathsep) + dirs
+    global _NPCAP_CONFIG_CACHE
+    if _NPCAP_CONFIG_CACHE is None:
+        config = {}
+        hkey = winreg.HKEY_LOCAL_MACHINE
+        node = r"SYSTEM\CurrentControlSet\Services\npcap\Parameters"
+        try:
+            with winreg.OpenKey(hkey, node) as key:
+                for i in itertools.count():
+                    try:
+                        name, value, _ = winreg.EnumValue(key, i)
+                    except OSError:  # No more values
+                        break
+                    config[name] = value
+        except OSError:  # Npcap isn't installed
+            pass
+        _NPCAP_CONFIG_CACHE = config
+    return _NPCAP_CONFIG_CACHE.get(param_key)
+
+
+def _clear_npcap_config_cache():
+    """Forget the Npcap registry parameters read by _get_npcap_config"""
+    global _NPCAP_CONFIG_CACHE
+    _NPCAP_CONFIG_CACHE = None
+
+
+def _list_dir_index(path, index=None):
+    """Add the content of a directory to an index of
+    {lowercase file name: path}. Already present names are kept.
+    """
+    if index is None:
+        index = {}
     try:
-        return next(os.path.normpath(match)
-                    for path in paths
-                    for match in glob(os.path.join(path, filename))
-                    if match)
-    except (StopIteration, RuntimeError):
-        raise IOError("File not found: %s" % filename)
+        names = os.listdir(path)
+    except (OSError, UnicodeError):
+        # Missing directory, or invalid PATH element
+        return index
+    for name in names:
+        index.setdefault(name.lower(), os.path.normpath(
+            os.path.join(path, name)
+        ))
+    return index
+
+
+def _build_exe_index(env="PATH"):
+    """Build the index of all files found in the current dir and
+    the system path. Each directory is listed only once.
+    """
+    index = {}
+    seen = set()
+    for path in [os.curdir] + os.environ.get(env, "").split(os.path.pathsep):
+        key = os.path.normcase(os.path.normpath(path))
+        if not path or key in seen:
+            continue
+        seen.add(key)
+        _list_dir_index(path, index)
+    return index
 
 
 def win_find_exe(filename, installsubdir=None, env="ProgramFiles"):
     """Find executable in current dir, system path or in the
     given ProgramFiles subdir, and retuen its absolute path.
     """
+    cache = WinProgPath._exe_index
+    if cache is None:
+        cache = WinProgPath._exe_index = {None: _build_exe_index()}
+    indexes = [cache[None]]
+    if installsubdir is not None and env in os.environ:
+        subdir = os.path.join(os.environ[env], installsubdir)
+        if subdir not in cache:
+            cache[subdir] = _list_dir_index(subdir)
+        indexes.append(cache[subdir])
     fns = [filename] if filename.endswith(".exe") else [filename + ".exe", filename]  # noqa: E501
     for fn in fns:
-        try:
-            if installsubdir is None:
-                path = _where(fn)
-            else:
-                path = _where(fn, dirs=[os.path.join(os.environ[env], installsubdir)])  # noqa: E501
-        except IOError:
-            path = None
-        else:
-            break
-    return path
+        fn = fn.lower()
+        for index in indexes:
+            if fn in index:
+                return index[fn]
+    return None
 
 
 class WinProgPath(ProgPath):
+    # Memoized directory listings used by win_find_exe:
+    # {None: <index of PATH>, installsubdir: <index of subdir>}
+    _exe_index = None
+
     def __init__(self):
         self._reload()
 
     def _reload(self):
+        # Re-scan the directories
+        WinProgPath._exe_index = None
         self.pdfreader = None
         self.psreader = None
         self.svgreader = None
@@ -200,10 +252,14 @@ class WinProgPath(ProgPath):
 
 
 def _exec_cmd(command):
-    """Call a CMD command and return the output and returncode"""
+    """Call a command and return the output and returncode.
+
+    command should be a list of arguments: it is executed directly,
+    without spawning an intermediate cmd.exe
+    """
     proc = sp.Popen(command,
                     stdout=sp.PIPE,
-                    shell=True)
+                    shell=False)
     res = proc.communicate()[0]
     return res, proc.returncode
 
@@ -221,7 +277,34 @@ if conf.prog.tcpdump and conf.use_npcap:
             return b"npcap" in _output and b"winpcap" not in _output
         except Exception:
             return False
-    windump_ok = test_windump_npcap()
+
+    def _test_windump_npcap_cached():
+        """Same as test_windump_npcap, but the result is stored on disk,
+        and only computed again if the windump binary changes"""
+        try:
+            stat = os.stat(conf.prog.tcpdump)
+            cache_path = os.path.join(os.environ["LOCALAPPDATA"],
+                                      "scapy", "windump_npcap_ok")
+        except (OSError, KeyError):
+            return test_windump_npcap()
+        key = "%s|%d|%d" % (conf.prog.tcpdump, stat.st_mtime, stat.st_size)
+        try:
+            with open(cache_path) as fd:
+                cached_key, cached_res = fd.read().rsplit("\n", 1)
+            if cached_key == key:
+                return cached_res == "1"
+        except (IOError, OSError, ValueError):
+            pass
+        res = test_windump_npcap()
+        try:
+            if not os.path.isdir(os.path.dirname(cache_path)):
+                os.makedirs(os.path.dirname(cache_path))
+            with open(cache_path, "w") as fd:
+                fd.write("%s\n%d" % (key, res))
+        except (IOError, OSError):
+            pass
+        return res
+    windump_ok = _test_windump_npcap_cached()
     if not windump_ok:
         log_loading.warning(
             "The installed Windump version does not work with Npcap! "
@@ -230,6 +313,16 @@ if conf.prog.tcpdump and conf.use_npcap:
     del windump_ok
 
 
+# SOCKADDR_INET fields to access an address: (union field,
+# address field, address length), by address family
+_SOCKADDR_IN_FIELDS = ("Ipv4", "sin_addr", 4)
+_SOCKADDR_IN6_FIELDS = ("Ipv6", "sin6_addr", 16)
+_SOCKADDR_INET_FIELDS = {
+    socket.AF_INET: _SOCKADDR_IN_FIELDS,
+    socket.AF_INET6: _SOCKADDR_IN6_FIELDS,
+}
+
+
 def get_windows_if_list(extended=False):
     """Returns windows interfaces through GetAdaptersAddresses.
 
@@ -254,18 +347,16 @@ def get_windows_if_list(extended=False):
             ips = []
             for ip in y:
                 addr = ip['address']['address'].contents
-                if addr.si_family == socket.AF_INET6:
-                    ip_key = "Ipv6"
-                    si_key = "sin6_addr"
-                else:
-                    ip_key = "Ipv4"
-                    si_key = "sin_addr"
+                ip_key, si_key, ip_len = _SOCKADDR_INET_FIELDS.get(
+                    addr.si_family, _SOCKADDR_IN_FIELDS
+                )
                 data = getattr(addr, ip_key)
                 data = getattr(data, si_key)
-                data = bytes(bytearray(data.byte))
+                # Single copy from the ctypes buffer
+                data = ctypes.string_at(ctypes.addressof(data.byte), ip_len)
                 # Build IP
                 if data:
-                    ips.append(inet_ntop(addr.si_family, data))
+                    ips.append(_inet_ntop(addr.si_family, data))
             return ips
 
         ips = []
@@ -304,6 +395,8 @@ def _pcapname_to_guid(pcap_name):
 
 class NetworkInterface_Win(NetworkInterface):
     """A network interface of your local host"""
+    __slots__ = ["cache_mode", "ipv4_metric", "ipv6_metric", "guid",
+                 "raw80211"]
 
     def __init__(self, provider, data=None):
         self.cache_mode = None
@@ -356,12 +449,34 @@ class NetworkInterface_Win(NetworkInterface):
         return True
 
     def _npcap_get(self, key):
-        res, code = _exec_cmd(" ".join([_WlanHelper, self.guid[1:-1], key]))
+        res, code = _exec_cmd([_WlanHelper, self.guid[1:-1], key])
         _windows_title()  # Reset title of the window
         if code != 0:
             raise OSError(res.decode("utf8", errors="ignore"))
         return plain_str(res.strip())
 
+    def _npcap_get_many(self, keys):
+        """Internal function. Get several [key] parameters at once.
+        A WlanHelper process is spawned per key: they run concurrently"""
+        results = {}
+        errors = {}
+
+        def _query(key):
+            try:
+                results[key] = self._npcap_get(key)
+            except Exception as ex:
+                # Re-raised in the calling thread
+                errors[key] = ex
+        threads = [Thread(target=_query, args=(key,)) for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for key in keys:
+            if key in errors:
+                raise errors[key]
+        return results
+
     def mode(self):
         """Get the interface operation mode.
         Only available with Npcap."""
@@ -469,6 +584,20 @@ class NetworkInterface_Win(NetworkInterface):
         self._check_npcap_requirement()
         return self._npcap_get("modu")
 
+    def query_all(self):
+        """Get the mode, channel, frequence and modulation of the interface
+        in a single call, faster than calling each getter.
+        Only available with Npcap."""
+        self._check_npcap_requirement()
+        res = self._npcap_get_many(["mode", "channel", "freq", "modu"])
+        self.cache_mode = (res["mode"] == "monitor")
+        return {
+            "mode": res["mode"],
+            "channel": int(res["channel"]),
+            "frequence": int(res["freq"]),
+            "modulation": res["modu"],
+        }
+
     def setmodulation(self, modu):
         """Set the interface modulation. It can be:
            - 0: dsss
@@ -563,6 +692,8 @@ class WindowsInterfacesProvider(InterfaceProvider):
             # Try a restart
             WindowsInterfacesProvider._pcap_check()
 
+        # Index the adapters by GUID, so that matching each pcap device
+        # is a single lookup. GUIDs are case insensitive.
         windows_interfaces = dict()
         for i in get_windows_if_list():
             # Detect Loopback interface
@@ -571,13 +702,13 @@ class WindowsInterfacesProvider(InterfaceProvider):
             if i['guid']:
                 if conf.use_npcap and i['name'] == conf.loopback_name:
                     i['guid'] = NPCAP_LOOPBACK_NAME
-                windows_interfaces[i['guid']] = i
+                windows_interfaces[i['guid'].upper()] = i
 
         index = 0
         for netw, if_data in six.iteritems(conf.cache_pcapiflist):
             name, ips, flags, _ = if_data
             guid = _pcapname_to_guid(netw)
-            data = windows_interfaces.get(guid, None)
+            data = windows_interfaces.get(guid.upper(), None)
             if data:
                 # Exists in Windows registry
                 data['network_name'] = netw
@@ -605,6 +736,7 @@ class WindowsInterfacesProvider(InterfaceProvider):
     def reload(self):
         """Reload interface list"""
         self.restarted_adapter = False
+        _clear_npcap_config_cache()
         if conf.use_pcap:
             # Reload from Winpcapy
             from scapy.arch.libpcap import load_winpcapy
@@ -619,13 +751,9 @@ conf.ifaces.register_provider(WindowsInterfacesProvider)
 def get_ips(v6=False):
     """Returns all available IPs matching to interfaces, using the windows system.
     Should only be used as a WinPcapy fallback."""
-    res = {}
-    for iface in six.itervalues(conf.ifaces):
-        if v6:
-            res[iface] = iface.ips[6]
-        else:
-            res[iface] = iface.ips[4]
-    return res
+    version = 6 if v6 else 4
+    return {iface: iface.ips[version]
+            for iface in six.itervalues(conf.ifaces)}
 
 
 def get_if_raw_addr(iff):
@@ -637,7 +765,7 @@ def get_if_raw_addr(iff):
 
 
 def get_ip_from_name(ifname, v6=False):
-    """Backward compatibility: indirectly calls get_ips
+    """Backward compatibility: returns the first IP of an interface
     Deprecated."""
     warnings.warn(
         "get_ip_from_name is deprecated. Use the `ip` attribute of the iface "
@@ -645,7 +773,8 @@ def get_ip_from_name(ifname, v6=False):
         DeprecationWarning
     )
     iface = conf.ifaces.dev_from_name(ifname)
-    return get_ips(v6=v6).get(iface, [""])[0]
+    ips = iface.ips[6 if v6 else 4]
+    return ips[0] if ips else ""
 
 
 def pcap_service_name():
@@ -661,8 +790,11 @@ def pcap_service_status():
 
 def _pcap_service_control(action, askadmin=True):
     """Internal util to run pcap control command"""
-    command = action + ' ' + pcap_service_name()
-    res, code = _exec_cmd(_encapsulate_admin(command) if askadmin else command)
+    command = action.split() + [pcap_service_name()]
+    if askadmin:
+        # Admin rights are requested through powershell
+        command = _encapsulate_admin(" ".join(command))
+    res, code = _exec_cmd(command)
     if code != 0:
         warning(res.decode("utf8", errors="ignore"))
     return (code == 0)
@@ -710,12 +842,19 @@ def get_if_raw_hwaddr(iface):
     return ARPHDR_ETHER, mac2str(iface.mac)
 
 
+# Pre-compiled struct formats
+_pack_le32 = struct.Struct("<I").pack
+_unpack_be32 = struct.Struct("!I").unpack
+# itom() of all the possible IPv4 prefix lengths
+_ITOM_TABLE = tuple(itom(i) for i in range(33))
+
+
 def _read_routes_c_v1():
     """Retrieve Windows routes through a GetIpForwardTable call.
 
     This is compatible with XP but won't get IPv6 routes."""
     def _extract_ip(obj):
-        return inet_ntop(socket.AF_INET, struct.pack("<I", obj))
+        return _inet_ntop(socket.AF_INET, _pack_le32(obj))
     routes = []
     for route in GetIpForwardTable():
         ifIndex = route['ForwardIfIndex']
@@ -731,7 +870,7 @@ def _read_routes_c_v1():
         except ValueError:
             continue
         ip = iface.ip
-        netw = network_name(iface)
+        netw = iface.network_name
         # RouteMetric + InterfaceMetric
         metric = metric + iface.ipv4_metric
         routes.append((dest, netmask, nexthop, netw, ip, metric))
@@ -743,24 +882,25 @@ def _read_routes_c(ipv6=False):
 
     This is not available on Windows XP !"""
     af = socket.AF_INET6 if ipv6 else socket.AF_INET
-    sock_addr_name = 'Ipv6' if ipv6 else 'Ipv4'
-    sin_addr_name = 'sin6_addr' if ipv6 else 'sin_addr'
-    metric_name = 'ipv6_metric' if ipv6 else 'ipv4_metric'
+    sock_addr_name, sin_addr_name, _ = _SOCKADDR_INET_FIELDS[af]
+    get_metric = operator.attrgetter(
+        'ipv6_metric' if ipv6 else 'ipv4_metric'
+    )
     if ipv6:
-        lifaddr = in6_getifaddr()
+        lifaddr_by_iface = _index_ifaddr(in6_getifaddr())
     routes = []
 
-    def _extract_ip(obj):
+    def _extract_raw_ip(obj):
         ip = obj[sock_addr_name][sin_addr_name]
-        ip = bytes(bytearray(ip['byte']))
-        # Build IP
-        ip = inet_ntop(af, ip)
-        return ip
+        return bytes(bytearray(ip['byte']))
+
+    def _extract_ip(obj):
+        return _inet_ntop(af, _extract_raw_ip(obj))
 
     for route in GetIpForwardTable2(af):
         # Extract data
         ifIndex = route['InterfaceIndex']
-        dest = _extract_ip(route['DestinationPrefix']['Prefix'])
+        dest = _extract_raw_ip(route['DestinationPrefix']['Prefix'])
         netmask = route['DestinationPrefix']['PrefixLength']
         nexthop = _extract_ip(route['NextHop'])
         metric = route['Metric']
@@ -772,25 +912,30 @@ def _read_routes_c(ipv6=False):
         except ValueError:
             continue
         ip = iface.ip
-        netw = network_name(iface)
+        netw = iface.network_name
         # RouteMetric + InterfaceMetric
-        metric = metric + getattr(iface, metric_name)
+        metric = metric + get_metric(iface)
         if ipv6:
-            _append_route6(routes, dest, netmask, nexthop,
-                           netw, lifaddr, metric)
+            _append_route6(routes, _inet_ntop(af, dest), netmask, nexthop,
+                           netw, lifaddr_by_iface, metric)
         else:
-            routes.append((atol(dest), itom(int(netmask)),
+            routes.append((_unpack_be32(dest)[0], _ITOM_TABLE[int(netmask)],
                            nexthop, netw, ip, metric))
     return routes
 
 
+# The IPv4 routes reader is chosen once and for all
+if WINDOWS_XP:
+    _read_routes4 = _read_routes_c_v1
+else:
+    def _read_routes4():
+        return _read_routes_c(ipv6=False)
+
+
 def read_routes():
     routes = []
     try:
-        if WINDOWS_XP:
-            routes = _read_routes_c_v1()
-        else:
-            routes = _read_routes_c(ipv6=False)
+        routes = _read_routes4()
     except Exception as e:
         log_loading.warning("Error building scapy IPv4 routing table : %s", e)
     return routes
@@ -801,31 +946,57 @@ def read_routes():
 ############
 
 
+# The scope of an address only depends on the address: memoize it
+_IN6_SCOPE_CACHE = {}
+_IN6_SCOPE_CACHE_SIZE = 4096
+
+
+def _cached_in6_getscope(ip):
+    """Same as in6_getscope, with a (bounded) cache"""
+    try:
+        return _IN6_SCOPE_CACHE[ip]
+    except KeyError:
+        pass
+    if len(_IN6_SCOPE_CACHE) >= _IN6_SCOPE_CACHE_SIZE:
+        _IN6_SCOPE_CACHE.clear()
+    scope = _IN6_SCOPE_CACHE[ip] = in6_getscope(ip)
+    return scope
+
+
 def in6_getifaddr():
     """
     Returns all IPv6 addresses found on the computer
     """
     ifaddrs = []
-    ip6s = get_ips(v6=True)
-    for iface in ip6s:
-        ips = ip6s[iface]
+    append = ifaddrs.append
+    for iface, ips in six.iteritems(get_ips(v6=True)):
         for ip in ips:
-            scope = in6_getscope(ip)
-            ifaddrs.append((ip, scope, iface))
+            append((ip, _cached_in6_getscope(ip), iface))
     # Appends Npcap loopback if available
     if conf.use_npcap and conf.loopback_name:
         ifaddrs.append(("::1", 0, conf.loopback_name))
     return ifaddrs
 
 
-def _append_route6(routes, dpref, dp, nh, iface, lifaddr, metric):
+def _index_ifaddr(lifaddr):
+    """Index the results of in6_getifaddr() by interface network name"""
+    lifaddr_by_iface = {}
+    for addr in lifaddr:
+        # str() of an interface is its network name
+        lifaddr_by_iface.setdefault(str(addr[2]), []).append(addr)
+    return lifaddr_by_iface
+
+
+def _append_route6(routes, dpref, dp, nh, iface, lifaddr_by_iface, metric):
+    """lifaddr_by_iface is the output of in6_getifaddr() indexed
+    by _index_ifaddr()"""
     cset = []  # candidate set (possible source addresses)
     if iface == conf.loopback_name:
         if dpref == '::':
             return
         cset = ['::1']
     else:
-        devaddrs = (x for x in lifaddr if x[2] == iface)
+        devaddrs = lifaddr_by_iface.get(iface, [])
         cset = construct_source_candidate_set(dpref, dp, devaddrs)
     if not cset:
         return
@@ -833,15 +1004,25 @@ def _append_route6(routes, dpref, dp, nh, iface, lifaddr, metric):
     routes.append((dpref, dp, nh, iface, cset, metric))
 
 
-def read_routes6():
-    routes6 = []
-    if WINDOWS_XP:
+if WINDOWS_XP:
+    def read_routes6():
+        # IPv6 routes are not available on Windows XP
+        return []
+else:
+    def read_routes6():
+        routes6 = []
+        try:
+            routes6 = _read_routes_c(ipv6=True)
+        except Exception as e:
+            log_loading.warning(
+                "Error building scapy IPv6 routing table : %s", e
+            )
         return routes6
-    try:
-        routes6 = _read_routes_c(ipv6=True)
-    except Exception as e:
-        log_loading.warning("Error building scapy IPv6 routing table : %s", e)
-    return routes6
+
+
+# Packed 127.0.0.0/8 network, used by _route_add_loopback
+_LOOPBACK_NET = 0x7F000000
+_LOOPBACK_MASK = 0xFF000000
 
 
 def _route_add_loopback(routes=None, ipv6=False, iflist=None):
@@ -850,6 +1031,7 @@ def _route_add_loopback(routes=None, ipv6=False, iflist=None):
         warning("Calling _route_add_loopback is only valid on Windows")
         return
     warning("This will completely mess up the routes. Testing purpose only !")
+    _IN6_SCOPE_CACHE.clear()
     # Add only if some adpaters already exist
     if ipv6:
         if not conf.route6.routes:
@@ -862,42 +1044,42 @@ def _route_add_loopback(routes=None, ipv6=False, iflist=None):
     if iflist:
         iflist.append(adapter.network_name)
         return
-    # Remove all conf.loopback_name routes
-    for route in list(conf.route.routes):
-        iface = route[3]
-        if iface == conf.loopback_name:
-            conf.route.routes.remove(route)
+    loopback_name = conf.loopback_name
+    # Remove all conf.loopback_name routes, in a single pass
+    conf.route.routes[:] = [route for route in conf.route.routes
+                            if route[3] != loopback_name]
     # Remove conf.loopback_name interface
-    for devname, iface in list(conf.ifaces.items()):
-        if iface == conf.loopback_name:
-            conf.ifaces.pop(devname)
+    for devname in [devname for devname, iface in conf.ifaces.items()
+                    if iface == loopback_name]:
+        del conf.ifaces[devname]
     # Inject interface
     conf.ifaces["{0XX00000-X000-0X0X-X00X-00XXXX000XXX}"] = adapter
     conf.loopback_name = adapter.network_name
-    if isinstance(conf.iface, NetworkInterface):
-        if conf.iface.network_name == conf.loopback_name:
-            conf.iface = adapter
+    # conf.iface6 is deprecated in favor of conf.iface: only check the latter
+    iface = conf.iface
+    if isinstance(iface, NetworkInterface) and \
+            iface.network_name == adapter.network_name:
+        conf.iface = adapter
     conf.netcache.arp_cache["127.0.0.1"] = "ff:ff:ff:ff:ff:ff"
     conf.netcache.in6_neighbor["::1"] = "ff:ff:ff:ff:ff:ff"
-    # Build the packed network addresses
-    loop_net = struct.unpack("!I", socket.inet_aton("127.0.0.0"))[0]
-    loop_mask = struct.unpack("!I", socket.inet_aton("255.0.0.0"))[0]
     # Build the fake routes
-    loopback_route = (loop_net, loop_mask, "0.0.0.0", adapter, "127.0.0.1", 1)
+    loopback_route = (_LOOPBACK_NET, _LOOPBACK_MASK, "0.0.0.0", adapter,
+                      "127.0.0.1", 1)
     loopback_route6 = ('::1', 128, '::', adapter, ["::1"], 1)
     loopback_route6_custom = ("fe80::", 128, "::", adapter, ["::1"], 1)
     if routes is None:
         # Injection
-        conf.route6.routes.append(loopback_route6)
-        conf.route6.routes.append(loopback_route6_custom)
-        conf.route.routes.append(loopback_route)
-        # Flush the caches
-        conf.route6.invalidate_cache()
-        conf.route.invalidate_cache()
+        try:
+            conf.route6.routes.extend([loopback_route6,
+                                       loopback_route6_custom])
+            conf.route.routes.append(loopback_route)
+        finally:
+            # Flush the caches, once
+            conf.route6.invalidate_cache()
+            conf.route.invalidate_cache()
     else:
         if ipv6:
-            routes.append(loopback_route6)
-            routes.append(loopback_route6_custom)
+            routes.extend([loopback_route6, loopback_route6_custom])
         else:
             routes.append(loopback_route)
 
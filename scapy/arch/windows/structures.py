@@ -241,6 +241,12 @@ def GetIcmpStatistics():
 MAX_ADAPTER_ADDRESS_LENGTH = 8
 MAX_DHCPV6_DUID_LENGTH = 130
 
+# Recommended by MSDN: "allocate a 15KB buffer to start"
+GAA_DEFAULT_BUFFER_SIZE = 15000
+GAA_MAX_TRIES = 2
+ERROR_BUFFER_OVERFLOW = 0x6f
+
+GAA_FLAG_SKIP_DNS_SERVER = 0x0008
 GAA_FLAG_INCLUDE_PREFIX = 0x0010
 GAA_FLAG_INCLUDE_ALL_INTERFACES = 0x0100
 # for now, just use void * for pointers to unused structures
@@ -434,22 +440,22 @@ _GetAdaptersAddresses = WINFUNCTYPE(ULONG, ULONG, ULONG,
 
 def GetAdaptersAddresses(AF=AF_UNSPEC):
     """Return all Windows Adapters addresses from iphlpapi"""
-    # We get the size first
-    size = ULONG()
-    flags = ULONG(GAA_FLAG_INCLUDE_PREFIX | GAA_FLAG_INCLUDE_ALL_INTERFACES)
-    res = _GetAdaptersAddresses(AF, flags,
-                                None, None,
-                                byref(size))
-    if res != 0x6f:  # BUFFER OVERFLOW -> populate size
-        raise RuntimeError("Error getting structure length (%d)" % res)
-    # Now let's build our buffer
+    # We pre-allocate a buffer big enough for most systems, which spares
+    # the call that would only return the needed size. If it still
+    # happens to be too small, retry once with the returned size.
+    size = ULONG(GAA_DEFAULT_BUFFER_SIZE)
+    flags = ULONG(GAA_FLAG_SKIP_DNS_SERVER | GAA_FLAG_INCLUDE_PREFIX |
+                  GAA_FLAG_INCLUDE_ALL_INTERFACES)
     pointer_type = POINTER(IP_ADAPTER_ADDRESSES)
-    buffer = create_string_buffer(size.value)
-    AdapterAddresses = ctypes.cast(buffer, pointer_type)
-    # And call GetAdaptersAddresses
-    res = _GetAdaptersAddresses(AF, flags,
-                                None, AdapterAddresses,
-                                byref(size))
+    for _ in range(GAA_MAX_TRIES):
+        buffer = create_string_buffer(size.value)
+        AdapterAddresses = ctypes.cast(buffer, pointer_type)
+        res = _GetAdaptersAddresses(AF, flags,
+                                    None, AdapterAddresses,
+                                    byref(size))
+        if res != ERROR_BUFFER_OVERFLOW:
+            break
+        # Too small: size now holds the required length
     if res != NO_ERROR:
         raise RuntimeError("Error retrieving table (%d)" % res)
     results = _resolve_list(AdapterAddresses)
@@ -13,16 +13,19 @@ Logging subsystem and basic exception class.
 
 
 import logging
-import traceback
+import sys
 import time
 
 from scapy.consts import WINDOWS
 
 # Typing imports
+import types
 from logging import LogRecord
 from scapy.compat import (
     Any,
     Dict,
+    List,
+    Optional,
     Tuple,
 )
 
@@ -53,12 +56,18 @@ class ScapyFreqFilter(logging.Filter):
             return True
         wt = conf.warning_threshold
         if wt > 0:
-            stk = traceback.extract_stack()
+            # Walk the frames rather than using traceback.extract_stack(),
+            # which also reads the source line of each frame.
+            stk = []  # type: List[Tuple[int, str]]
+            frame = sys._getframe()  # type: Optional[types.FrameType]
+            while frame is not None:
+                stk.append((frame.f_lineno, frame.f_code.co_name))
+                frame = frame.f_back
             caller = 0  # type: int
-            for _, l, n, _ in stk:
-                if n == 'warning':
+            for lineno, name in reversed(stk):
+                if name == 'warning':
                     break
-                caller = l
+                caller = lineno
             tm, nb = self.warning_table.get(caller, (0, 0))
             ltm = time.time()
             if ltm - tm > wt:
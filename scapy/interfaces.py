@@ -15,9 +15,8 @@ from collections import defaultdict
 from scapy.config import conf
 from scapy.consts import WINDOWS
 from scapy.utils import pretty_list
-from scapy.utils6 import in6_isvalid
 
-from scapy.modules.six.moves import UserDict
+from scapy.modules.six.moves import UserDict, intern
 import scapy.modules.six as six
 
 # Typing imports
@@ -32,9 +31,18 @@ from scapy.compat import (
     Tuple,
     Type,
     Union,
+    cast,
 )
 
 
+def _intern(string):
+    # type: (str) -> str
+    """Interns a string if possible (not unicode on Python 2)"""
+    if isinstance(string, str):
+        return cast(str, intern(string))
+    return string
+
+
 class InterfaceProvider(object):
     name = "Unknown"
     headers = ("Index", "Name", "MAC", "IPv4", "IPv6")
@@ -93,6 +101,11 @@ class InterfaceProvider(object):
 
 
 class NetworkInterface(object):
+    # There can be many interfaces: don't use a __dict__ per instance.
+    # Subclasses must declare their own attributes in __slots__
+    __slots__ = ["provider", "name", "description", "network_name",
+                 "index", "ip", "ips", "mac", "flags", "dummy"]
+
     def __init__(self,
                  provider,  # type: InterfaceProvider
                  data=None,  # type: Optional[Dict[str, Any]]
@@ -106,6 +119,7 @@ class NetworkInterface(object):
         self.ip = None  # type: Optional[str]
         self.ips = defaultdict(list)  # type: DefaultDict[int, List[str]]
         self.mac = None  # type: Optional[str]
+        self.flags = 0
         self.dummy = False
         if data is not None:
             self.update(data)
@@ -115,20 +129,21 @@ class NetworkInterface(object):
         """Update info about a network interface according
         to a given dictionary. Such data is provided by providers
         """
-        self.name = data.get('name', "")
-        self.description = data.get('description', "")
-        self.network_name = data.get('network_name', "")
+        # Interned: those are compared and hashed on every lookup
+        self.name = _intern(data.get('name', ""))
+        self.description = _intern(data.get('description', ""))
+        self.network_name = _intern(data.get('network_name', ""))
         self.index = data.get('index', 0)
         self.ip = data.get('ip', "")
         self.mac = data.get('mac', "")
         self.flags = data.get('flags', 0)
         self.dummy = data.get('dummy', False)
 
+        # Only IPv6 addresses contain ':'. This is much cheaper than
+        # validating each address, and is done in a single pass.
+        ips = self.ips
         for ip in data.get('ips', []):
-            if in6_isvalid(ip):
-                self.ips[6].append(ip)
-            else:
-                self.ips[4].append(ip)
+            ips[6 if ":" in ip else 4].append(ip)
 
         # An interface often has multiple IPv6 so we don't store
         # a "main" one, unlike IPv4.
@@ -137,12 +152,28 @@ class NetworkInterface(object):
 
     def __eq__(self, other):
         # type: (Any) -> bool
+        if other is self:
+            # Interfaces are shared (conf.ifaces, conf.iface, routes...):
+            # skip comparing all the attributes
+            return True
         if isinstance(other, str):
-            return other in [self.name, self.network_name, self.description]
+            return other in (self.name, self.network_name, self.description)
         if isinstance(other, NetworkInterface):
-            return self.__dict__ == other.__dict__
+            return self._attrs() == other._attrs()
         return False
 
+    def _attrs(self):
+        # type: () -> Dict[str, Any]
+        """Returns all the attributes of the interface"""
+        attrs = {
+            attr: getattr(self, attr, None)
+            for klass in type(self).__mro__
+            for attr in getattr(klass, "__slots__", [])
+        }
+        # Subclasses that don't define __slots__
+        attrs.update(getattr(self, "__dict__", {}))
+        return attrs
+
     def __ne__(self, other):
         # type: (Any) -> bool
         return not self.__eq__(other)
@@ -194,8 +225,73 @@ class NetworkInterfaceDict(UserDict):
     def __init__(self):
         # type: () -> None
         self.providers = {}  # type: Dict[Type[InterfaceProvider], InterfaceProvider]  # noqa: E501
+        # Lookup tables used by the dev_from_* functions
+        self._index = None  # type: Optional[Dict[str, Dict[Any, NetworkInterface]]]  # noqa: E501
+        # (indexed dict, its length) to detect changes made behind our back
+        self._index_sig = None  # type: Optional[Tuple[Dict[str, NetworkInterface], int]]  # noqa: E501
+        self._valid_ifaces = []  # type: List[NetworkInterface]
         UserDict.__init__(self)
 
+    def __setitem__(self, key, item):
+        # type: (str, NetworkInterface) -> None
+        UserDict.__setitem__(self, key, item)
+        self._invalidate_index()
+
+    def __delitem__(self, key):
+        # type: (str) -> None
+        UserDict.__delitem__(self, key)
+        self._invalidate_index()
+
+    def _invalidate_index(self):
+        # type: () -> None
+        """Must be called when self.data is modified directly"""
+        self._index = None
+
+    def _check_index(self):
+        # type: () -> Dict[str, Dict[Any, NetworkInterface]]
+        """Builds the lookup tables and the list of valid interfaces,
+        if the interfaces changed since they were last built"""
+        # Also catch changes that bypassed _invalidate_index(). The dict
+        # is compared by identity, as the id() of a freed dict is reused.
+        data = self.data
+        sig = self._index_sig
+        if self._index is None or sig is None or sig[0] is not data or \
+                sig[1] != len(data):
+            by_name = {}  # type: Dict[Any, NetworkInterface]
+            by_network_name = {}  # type: Dict[Any, NetworkInterface]
+            by_index = {}  # type: Dict[Any, NetworkInterface]
+            valid = []  # type: List[NetworkInterface]
+            for iface in six.itervalues(data):
+                by_name.setdefault(iface.name, iface)
+                by_name.setdefault(iface.description, iface)
+                by_network_name.setdefault(iface.network_name, iface)
+                by_index.setdefault(iface.index, iface)
+                if iface.is_valid():
+                    valid.append(iface)
+            self._index = {
+                "name": by_name,
+                "network_name": by_network_name,
+                "index": by_index,
+            }
+            self._index_sig = (data, len(data))
+            self._valid_ifaces = valid
+        return self._index
+
+    def _get_index(self, key):
+        # type: (str) -> Dict[Any, NetworkInterface]
+        """Returns a lookup table of the interfaces by 'name' (and
+        description), 'network_name' or 'index'. The first interface
+        wins, like the linear scans it replaces.
+        """
+        return self._check_index()[key]
+
+    def _get_valid_ifaces(self):
+        # type: () -> List[NetworkInterface]
+        """Returns the valid interfaces, in order. Like the lookup
+        tables, this is only recomputed when the interfaces change."""
+        self._check_index()
+        return self._valid_ifaces
+
     def _load(self,
               dat,  # type: Dict[str, NetworkInterface]
               prov,  # type: InterfaceProvider
@@ -208,6 +304,7 @@ class NetworkInterfaceDict(UserDict):
                     self.data[ifname] = iface
             else:
                 self.data[ifname] = iface
+        self._invalidate_index()
 
     def register_provider(self, provider):
         # type: (type) -> None
@@ -242,18 +339,16 @@ class NetworkInterfaceDict(UserDict):
         device name.
         """
         try:
-            return next(iface for iface in six.itervalues(self)  # type: ignore
-                        if (iface.name == name or iface.description == name))
-        except (StopIteration, RuntimeError):
+            return self._get_index("name")[name]
+        except (KeyError, TypeError):
             raise ValueError("Unknown network interface %r" % name)
 
     def dev_from_networkname(self, network_name):
         # type: (str) -> NoReturn
         """Return interface for a given network device name."""
         try:
-            return next(iface for iface in six.itervalues(self)  # type: ignore
-                        if iface.network_name == network_name)
-        except (StopIteration, RuntimeError):
+            return self._get_index("network_name")[network_name]  # type: ignore  # noqa: E501
+        except (KeyError, TypeError):
             raise ValueError(
                 "Unknown network interface %r" %
                 network_name)
@@ -263,9 +358,8 @@ class NetworkInterfaceDict(UserDict):
         """Return interface name from interface index"""
         try:
             if_index = int(if_index)  # Backward compatibility
-            return next(iface for iface in six.itervalues(self)  # type: ignore
-                        if iface.index == if_index)
-        except (StopIteration, RuntimeError):
+            return self._get_index("index")[if_index]
+        except KeyError:
             if str(if_index) == "1":
                 # Test if the loopback interface is set up
                 return self.dev_from_networkname(conf.loopback_name)
@@ -301,6 +395,7 @@ class NetworkInterfaceDict(UserDict):
             )
         else:
             self.data[ifname] = NetworkInterface(InterfaceProvider(), data)
+        self._invalidate_index()
 
     def show(self, print_result=True, hidden=False, **kwargs):
         # type: (bool, bool, **Any) -> Optional[str]
@@ -352,9 +447,7 @@ def get_working_if():
     """Return an interface that works"""
     # return the interface associated with the route with smallest
     # mask (route by default if it exists)
-    routes = conf.route.routes[:]
-    routes.sort(key=lambda x: x[1])
-    ifaces = (x[3] for x in routes)
+    ifaces = conf.route.ifaces_by_mask()
     # First check the routing ifaces from best to worse,
     # then check all the available ifaces as backup.
     for ifname in itertools.chain(ifaces, conf.ifaces.values()):
@@ -368,7 +461,7 @@ def get_working_if():
 def get_working_ifaces():
     # type: () -> List[NetworkInterface]
     """Return all interfaces that work"""
-    return [iface for iface in conf.ifaces.values() if iface.is_valid()]
+    return list(conf.ifaces._get_valid_ifaces())
 
 
 def dev_from_networkname(network_name):
@@ -390,13 +483,15 @@ def resolve_iface(dev):
     """
     if isinstance(dev, NetworkInterface):
         return dev
+    # This is called for each socket: lookup the tables directly,
+    # rather than catching the errors of dev_from_*
     try:
-        return conf.ifaces.dev_from_name(dev)
-    except ValueError:
-        try:
-            return dev_from_networkname(dev)
-        except ValueError:
-            pass
+        for key in ("name", "network_name"):
+            iface = conf.ifaces._get_index(key).get(dev)
+            if iface is not None:
+                return iface
+    except TypeError:  # unhashable
+        pass
     # Return a dummy interface
     return NetworkInterface(
         InterfaceProvider(),
@@ -21,6 +21,7 @@ from scapy.compat import (
     Dict,
     List,
     Optional,
+    Set,
     Tuple,
     Union,
 )
@@ -39,6 +40,11 @@ class Route:
     def invalidate_cache(self):
         # type: () -> None
         self.cache = {}  # type: Dict[str, Tuple[str, str, str]]
+        # Results derived from the routes: (routes list, its length, result).
+        # The list is compared by identity, as the id() of a freed list
+        # is reused.
+        self._ifaces_by_mask_cache = None  # type: Optional[Tuple[List[Tuple[int, int, str, str, str, int]], int, List[str]]]  # noqa: E501
+        self._lookup_table_cache = None  # type: Optional[Tuple[List[Tuple[int, int, str, str, str, int]], int, List[Tuple[int, int, int, int, Tuple[str, str, str]]]]]  # noqa: E501
 
     def resync(self):
         # type: () -> None
@@ -46,6 +52,47 @@ class Route:
         self.invalidate_cache()
         self.routes = read_routes()
 
+    def ifaces_by_mask(self):
+        # type: () -> List[str]
+        """Return the interfaces of the routes, sorted from the smallest
+        mask (default route) to the biggest, without duplicates.
+
+        The result is cached until the routes change."""
+        routes = self.routes
+        cached = self._ifaces_by_mask_cache
+        if cached is not None and cached[0] is routes and \
+                cached[1] == len(routes):
+            return cached[2]
+        ifaces = []  # type: List[str]
+        seen = set()  # type: Set[str]
+        for route in sorted(routes, key=lambda x: x[1]):
+            if route[3] not in seen:
+                seen.add(route[3])
+                ifaces.append(route[3])
+        self._ifaces_by_mask_cache = (routes, len(routes), ifaces)
+        return ifaces
+
+    def _lookup_table(self):
+        # type: () -> List[Tuple[int, int, int, int, Tuple[str, str, str]]]
+        """Return the routes that have an output IP, preprocessed for
+        route(): (network & mask, mask, metric, output IP as int,
+        (iface, output IP, gateway)).
+
+        The result is cached until the routes change."""
+        routes = self.routes
+        cached = self._lookup_table_cache
+        if cached is not None and cached[0] is routes and \
+                cached[1] == len(routes):
+            return cached[2]
+        table = [
+            (d & m, m, me, atol(a), (i, a, gw))
+            for d, m, gw, i, a, me in routes
+            # some interfaces may not currently be connected
+            if a
+        ]
+        self._lookup_table_cache = (routes, len(routes), table)
+        return table
+
     def __repr__(self):
         # type: () -> str
         rtlst = []  # type: List[Tuple[Union[str, List[str]], ...]]
@@ -175,16 +222,13 @@ class Route:
 
         atol_dst = atol(_dst)
         paths = []
-        for d, m, gw, i, a, me in self.routes:
-            if not a:  # some interfaces may not currently be connected
-                continue
-            aa = atol(a)
+        for net, m, me, aa, path in self._lookup_table():
             if aa == atol_dst:
                 paths.append(
-                    (0xffffffff, 1, (conf.loopback_name, a, "0.0.0.0"))  # noqa: E501
+                    (0xffffffff, 1, (conf.loopback_name, path[1], "0.0.0.0"))  # noqa: E501
                 )
-            if (atol_dst & m) == (d & m):
-                paths.append((m, me, (i, a, gw)))
+            if (atol_dst & m) == net:
+                paths.append((m, me, path))
 
         if not paths:
             if verbose: